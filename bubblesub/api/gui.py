@@ -42,6 +42,10 @@ class GuiApi(QtCore.QObject):
         super().__init__()
         self._api = api
         self._main_window: T.Optional[QtWidgets.QWidget] = None
+        self._dialog_dir: T.Optional[Path] = None
+
+        api.subs.loaded.connect(self._update_dialog_dir)
+        api.subs.saved.connect(self._update_dialog_dir)
 
     def set_main_window(self, main_window: QtWidgets.QWidget) -> None:
         """Set main window instance, needed to interact with the GUI.
@@ -119,9 +123,11 @@ class GuiApi(QtCore.QObject):
 
         :return: default path
         """
-        if self._api.subs.path:
-            return self._api.subs.path.parent
-        return None
+        return self._dialog_dir
+
+    def _update_dialog_dir(self) -> None:
+        path = self._api.subs.path
+        self._dialog_dir = path.parent if path else None
 
     @contextlib.contextmanager
     def throttle_updates(self) -> T.Any:
@@ -19,7 +19,6 @@
 import functools
 import queue
 import threading
-import time
 import typing as T
 
 from PyQt5 import QtCore
@@ -67,7 +66,6 @@ class QueueWorker(QtCore.QRunnable):
         super().__init__()
         self._log_api = log_api
         self._running = False
-        self._clearing = False
         self._queue: queue.Queue[  # pylint: disable=unsubscriptable-object
             T.Any
         ] = queue.Queue()
@@ -84,10 +82,6 @@ class QueueWorker(QtCore.QRunnable):
         with self._log_api.exception_guard():
             self._started()
         while self._running:
-            if self._clearing:
-                time.sleep(0.1)
-                continue
-
             task = self._queue.get()
             if task is None:
                 break
@@ -121,14 +115,15 @@ class QueueWorker(QtCore.QRunnable):
 
         Doesn't fire the finished signal.
         """
-        self._clearing = True
-        while not self._queue.empty():
-            try:
-                self._queue.get(False)
-            except queue.Empty:
-                continue
-            self._queue.task_done()
-        self._clearing = False
+        # drop everything at once rather than replacing the queue, since
+        # run() might be blocked on the current instance
+        # (relies on queue.Queue's mutex, queue, unfinished_tasks and
+        # all_tasks_done internals)
+        with self._queue.mutex:
+            self._queue.unfinished_tasks -= len(self._queue.queue)
+            self._queue.queue.clear()
+            if not self._queue.unfinished_tasks:
+                self._queue.all_tasks_done.notify_all()
 
     def _started(self) -> None:
         """Called when the thread starts."""
@@ -189,6 +184,13 @@ class ThreadingApi:
     def schedule_runnable(self, runnable: QtCore.QRunnable) -> None:
         """Schedule a QRunnable to run in the background thread pool.
 
+        Such runnables (e.g. queue workers) are expected to occupy their
+        thread for the lifetime of the program, so the pool is grown by one
+        thread for each of them to keep one shot tasks from starving.
+
         :param runnable: QRunnable to schedule
         """
+        self._thread_pool.setMaxThreadCount(
+            self._thread_pool.maxThreadCount() + 1
+        )
         self._thread_pool.start(runnable)
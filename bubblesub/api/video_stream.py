@@ -17,7 +17,12 @@
 """Video API."""
 
 import bisect
+import collections
+import concurrent.futures
 import fractions
+import multiprocessing
+import multiprocessing.connection
+import os
 import threading
 import time
 import typing as T
@@ -33,21 +38,153 @@ from bubblesub.api.log import LogApi
 from bubblesub.api.subs import SubtitlesApi
 from bubblesub.api.threading import ThreadingApi
 from bubblesub.ass_renderer import AssRenderer
+from bubblesub.cache import (
+    get_cache_file_path,
+    get_file_fingerprint,
+    load_cache,
+    save_cache,
+)
 
 _LOADING = object()
 _SAMPLER_LOCK = threading.Lock()
 _PIX_FMT = [ffms2.get_pix_fmt("rgb24")]
 
 
+def _index_video(
+    source_path: str,
+    index_path: str,
+    connection: multiprocessing.connection.Connection,
+) -> None:
+    """Create FFMS index of a video file and write it to disk.
+
+    Runs in the indexing process. FFMS errors and errors writing the index
+    are sent back to the parent process through the given connection.
+
+    :param source_path: path to the video file
+    :param index_path: path to write the index to
+    :param connection: connection to report errors through
+    """
+    try:
+        ffms2.Index.make(source_path).write(index_path)
+    except (ffms2.Error, OSError) as ex:
+        connection.send(ex)
+
+
+def _index_video_in_subprocess(source_path: str, index_path: str) -> None:
+    """Create FFMS index of a video file in a separate process.
+
+    The process is spawned rather than forked, as forking a multithreaded Qt
+    application is unsafe, and it exits after indexing so that the memory
+    FFMS allocates is given back to the system.
+
+    :param source_path: path to the video file
+    :param index_path: path to write the index to
+    :raises ffms2.Error: if FFMS fails to index the file
+    :raises OSError: if the index can't be written
+    :raises ChildProcessError: if the indexing process dies
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_index_video, args=(source_path, index_path, sender)
+    )
+    process.start()
+    sender.close()
+    try:
+        # returns as soon as the process reports an error or exits
+        error = receiver.recv()
+    except EOFError:
+        error = None
+    process.join()
+    if error is not None:
+        raise error
+    if process.exitcode:
+        raise ChildProcessError(
+            f"indexing process exited with code {process.exitcode}"
+        )
+
+
+def _pack_int64(values: T.Sequence[int]) -> T.Sequence[int]:
+    """Pack integers into a compact, read-only sequence.
+
+    :param values: integers to pack
+    :return: read-only view over a buffer of signed 64-bit integers
+    """
+    return memoryview(np.asarray(values, dtype=np.int64).tobytes()).cast("q")
+
+
+def _load_video_index(log_api: LogApi, path: Path) -> ffms2.Index:
+    """Read FFMS index of a video file from disk cache, creating it if needed.
+
+    :param log_api: logging API
+    :param path: path to the video file
+    :return: FFMS index
+    """
+    index_path = get_cache_file_path(
+        f"{get_file_fingerprint(path)}-video-index"
+    )
+    try:
+        return ffms2.Index.read(str(index_path), str(path))
+    except ffms2.Error:
+        pass
+
+    # the indexing process dying (e.g. killed for running out of memory)
+    # is reported as ChildProcessError, which is an OSError too, but unlike
+    # cache I/O errors it would most likely just happen again in-process
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        _index_video_in_subprocess(str(path), str(index_path))
+    except ChildProcessError:
+        raise
+    except OSError as ex:
+        log_api.warn(f"error caching video index for {path} ({ex})")
+        return ffms2.Index.make(str(path))
+    return ffms2.Index.read(str(index_path), str(path))
+
+
+def _load_video_frame_info(
+    log_api: LogApi, path: Path, source: ffms2.VideoSource
+) -> T.Tuple[np.array, np.array]:
+    """Read frame timecodes and keyframes of a video file from disk cache,
+    extracting them from video source if needed.
+
+    :param log_api: logging API
+    :param path: path to the video file
+    :param source: video source
+    :return: sorted timecodes and sorted keyframe indexes
+    """
+    cache_name = f"{get_file_fingerprint(path)}-video-frames"
+    cache = load_cache(cache_name)
+    if (
+        isinstance(cache, dict)
+        and "timecodes" in cache
+        and "keyframes" in cache
+    ):
+        return cache["timecodes"], cache["keyframes"]
+
+    cache = {
+        "timecodes": np.array(
+            sorted(int(round(pts)) for pts in source.track.timecodes),
+            dtype=np.int64,
+        ),
+        "keyframes": np.array(sorted(source.track.keyframes), dtype=np.int64),
+    }
+    try:
+        save_cache(cache_name, cache)
+    except OSError as ex:
+        log_api.warn(f"error caching frame info for {path} ({ex})")
+    return cache["timecodes"], cache["keyframes"]
+
+
 def _load_video_source(
     log_api: LogApi, uid: uuid.UUID, path: Path
-) -> T.Optional[ffms2.VideoSource]:
+) -> T.Optional[T.Tuple[ffms2.VideoSource, np.array, np.array]]:
     """Create video source.
 
     :param log_api: logging API
     :param uid: uid of the stream (for logging)
     :param path: path to the video file
-    :return: input path and resulting video source
+    :return: resulting video source with its timecodes and keyframes
     """
     log_api.info(f"video {uid} started loading ({path})")
 
@@ -56,13 +193,15 @@ def _load_video_source(
         return None
 
     try:
-        source = ffms2.VideoSource(str(path))
-    except ffms2.Error as ex:
+        index = _load_video_index(log_api, path)
+        source = ffms2.VideoSource(str(path), index=index)
+        timecodes, keyframes = _load_video_frame_info(log_api, path, source)
+    except (ffms2.Error, ChildProcessError) as ex:
         log_api.error(f"error loading video {uid} ({ex})")
         return None
     else:
         log_api.info(f"video {uid} finished loading")
-        return source
+        return source, timecodes, keyframes
 
 
 class VideoStream(QtCore.QObject):
@@ -94,8 +233,8 @@ class VideoStream(QtCore.QObject):
         self.uid = uuid.uuid4()
 
         self._path = path
-        self._timecodes: T.List[int] = []
-        self._keyframes: T.List[int] = []
+        self._timecodes = _pack_int64([])
+        self._keyframes = _pack_int64([])
         self._frame_rate = fractions.Fraction(0, 1)
         self._aspect_ratio = fractions.Fraction(1, 1)
         self._width = 0
@@ -144,7 +283,49 @@ class VideoStream(QtCore.QObject):
         :param width: optional width to render to
         :param height: optional height to render to
         """
+        size = self._get_screenshot_size(width, height)
+        if include_subtitles:
+            self._set_ass_renderer_source(size)
+        image = self._grab_screenshot(pts, size, include_subtitles)
+        image.save(str(path))
+
+    def screenshots(
+        self,
+        targets: T.Iterable[T.Tuple[int, Path]],
+        include_subtitles: bool,
+        width: T.Optional[int],
+        height: T.Optional[int],
+    ) -> None:
+        """Save many screenshots at once.
+
+        The frames are decoded one after another from the same video source,
+        while encoding and saving the images happens in parallel.
 
+        :param targets:
+            pairs of PTS to make screenshot of and path to save it to
+        :param include_subtitles: whether to 'burn in' the subtitles
+        :param width: optional width to render to
+        :param height: optional height to render to
+        """
+        size = self._get_screenshot_size(width, height)
+        if include_subtitles:
+            self._set_ass_renderer_source(size)
+        max_workers = os.cpu_count() or 1
+        pending: T.Deque[concurrent.futures.Future[None]] = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            for pts, path in targets:
+                # decoding outpaces encoding, so wait for the oldest image
+                # to be saved rather than piling decoded frames up in memory
+                if len(pending) >= max_workers:
+                    pending.popleft().result()
+                image = self._grab_screenshot(pts, size, include_subtitles)
+                pending.append(executor.submit(image.save, str(path)))
+            for future in pending:
+                future.result()
+
+    def _get_screenshot_size(
+        self, width: T.Optional[int], height: T.Optional[int]
+    ) -> T.Tuple[int, int]:
         if width and height:
             grab_width = width
             grab_height = height
@@ -161,26 +342,33 @@ class VideoStream(QtCore.QObject):
         if grab_width <= 0 or grab_height <= 0:
             raise ValueError("cannot take a screenshot at negative resolution")
 
+        return (grab_width, grab_height)
+
+    def _set_ass_renderer_source(self, size: T.Tuple[int, int]) -> None:
+        self._ass_renderer.set_source(
+            self._subs_api.styles,
+            self._subs_api.events,
+            self._subs_api.meta,
+            size,
+        )
+
+    def _grab_screenshot(
+        self, pts: int, size: T.Tuple[int, int], include_subtitles: bool
+    ) -> PIL.Image.Image:
         pts = self.align_pts_to_prev_frame(pts)
-        idx = self.timecodes.index(pts)
-        frame = self.get_frame(idx, grab_width, grab_height)
+        idx = bisect.bisect_left(self.timecodes, pts)
+        frame = self.get_frame(idx, *size)
         if not frame.flags.c_contiguous:
             frame = frame.copy(order="C")
-        image = PIL.Image.frombytes("RGB", (grab_width, grab_height), frame)
+        image = PIL.Image.frombytes("RGB", size, frame)
 
         if include_subtitles:
-            self._ass_renderer.set_source(
-                self._subs_api.styles,
-                self._subs_api.events,
-                self._subs_api.meta,
-                (grab_width, grab_height),
-            )
             subs_image = self._ass_renderer.render(
                 time=pts, aspect_ratio=self._aspect_ratio
             )
             image = PIL.Image.composite(subs_image, image, subs_image)
 
-        image.save(str(path))
+        return image
 
     def align_pts_to_near_frame(self, pts: int) -> int:
         """Align PTS to a frame closest to given PTS.
@@ -277,7 +465,7 @@ class VideoStream(QtCore.QObject):
         return self._aspect_ratio
 
     @property
-    def timecodes(self) -> T.List[int]:
+    def timecodes(self) -> T.Sequence[int]:
         """Return video frames' PTS.
 
         :return: video frames' PTS
@@ -287,7 +475,7 @@ class VideoStream(QtCore.QObject):
         return self._timecodes
 
     @property
-    def keyframes(self) -> T.List[int]:
+    def keyframes(self) -> T.Sequence[int]:
         """Return video keyframes' indexes.
 
         :return: video keyframes' indexes
@@ -333,34 +521,78 @@ class VideoStream(QtCore.QObject):
                 or frame_idx >= len(self.timecodes)
             ):
                 return None
-            assert self._source
-
-            new_output_fmt = (_PIX_FMT, width, height, ffms2.FFMS_RESIZER_AREA)
-            if self._last_output_fmt != new_output_fmt:
-                self._source.set_output_format(*new_output_fmt)
-                self._last_output_fmt = new_output_fmt
-
-            frame = self._source.get_frame(frame_idx)
-            return (
-                frame.planes[0]
-                .reshape((height, frame.Linesize[0]))[:, 0 : width * 3]
-                .reshape(height, width, 3)
-            )
+            self._set_output_format(width, height)
+            return self._decode_frame(frame_idx, width, height)
 
-    def _got_source(self, source: ffms2.VideoSource) -> None:
-        with _SAMPLER_LOCK:
-            self._source = source
+    def get_frames(
+        self,
+        frame_idxs: T.Sequence[int],
+        width: int,
+        height: int,
+        out: np.array,
+    ) -> np.array:
+        """Decode raw video data for many frames into an existing array.
+
+        Each frame is copied straight from the decoder into the given array.
+        The source is locked for one frame at a time, so that loading other
+        streams doesn't have to wait for the whole batch.
+
+        :param frame_idxs: frame numbers
+        :param width: output image width
+        :param height: output image height
+        :param out:
+            array to write the images to, indexed by frame number; each of
+            its items must accept an image of shape (height, width, 3)
+        :return: mask of frames that could be decoded
+        """
+        decoded = np.zeros(len(frame_idxs), dtype=np.bool_)
+        for i, frame_idx in enumerate(frame_idxs):
+            with _SAMPLER_LOCK:
+                if not self._wait_for_source():
+                    break
+                if not 0 <= frame_idx < len(self.timecodes):
+                    continue
+                self._set_output_format(width, height)
+                out[frame_idx] = self._decode_frame(frame_idx, width, height)
+                decoded[i] = True
+        return decoded
+
+    def _set_output_format(self, width: int, height: int) -> None:
+        assert self._source
+        new_output_fmt = (_PIX_FMT, width, height, ffms2.FFMS_RESIZER_AREA)
+        if self._last_output_fmt != new_output_fmt:
+            self._source.set_output_format(*new_output_fmt)
+            self._last_output_fmt = new_output_fmt
+
+    def _decode_frame(
+        self, frame_idx: int, width: int, height: int
+    ) -> np.array:
+        assert self._source
+        frame = self._source.get_frame(frame_idx)
+        return (
+            frame.planes[0]
+            .reshape((height, frame.Linesize[0]))[:, 0 : width * 3]
+            .reshape(height, width, 3)
+        )
 
-            if source is None:
+    def _got_source(
+        self,
+        result: T.Optional[T.Tuple[ffms2.VideoSource, np.array, np.array]],
+    ) -> None:
+        with _SAMPLER_LOCK:
+            if result is None:
+                self._source = None
                 self.errored.emit()
                 return
 
-            self._timecodes = [
-                int(round(pts)) for pts in source.track.timecodes
-            ]
-            self._keyframes = source.track.keyframes[:]
-            self._timecodes.sort()
-            self._keyframes.sort()
+            source, timecodes, keyframes = result
+            self._source = source
+
+            # packed int64 buffers rather than lists of boxed ints; they also
+            # let numpy.searchsorted work on the buffer without a copy, and
+            # being read-only, they can be handed out to callers as they are
+            self._timecodes = _pack_int64(timecodes)
+            self._keyframes = _pack_int64(keyframes)
 
             self._frame_rate = fractions.Fraction(
                 self._source.properties.FPSNumerator,
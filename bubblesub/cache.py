@@ -16,13 +16,20 @@
 
 """Caching utilities."""
 
+import functools
+import hashlib
 import pickle
 import typing as T
+import zipfile
 from pathlib import Path
 
+import numpy as np
+
 from bubblesub.data import USER_CACHE_DIR
 
 CACHE_SUFFIX = ".dat"
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+ZIP_MAGIC = b"PK\x03\x04"
 
 
 def get_cache_dir() -> Path:
@@ -42,6 +49,35 @@ def get_cache_file_path(cache_name: str) -> Path:
     return get_cache_dir() / (cache_name + CACHE_SUFFIX)
 
 
+def get_file_fingerprint(path: Path) -> str:
+    """Compute a cheap identity of a file, suitable for cache names.
+
+    Rather than hashing the entire file, which can be gigabytes for videos,
+    only its size, modification time and its first and last megabyte are
+    taken into account. Results are memoized for as long as the file size
+    and modification time stay the same.
+
+    :param path: path to the file
+    :return: hex digest identifying the file
+    """
+    stat = path.stat()
+    return _get_file_fingerprint(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_file_fingerprint(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{size}:{mtime_ns}".encode())
+    with open(path, mode="rb") as handle:
+        digest.update(handle.read(FINGERPRINT_CHUNK_SIZE))
+        if size > FINGERPRINT_CHUNK_SIZE:
+            handle.seek(
+                max(FINGERPRINT_CHUNK_SIZE, size - FINGERPRINT_CHUNK_SIZE)
+            )
+            digest.update(handle.read())
+    return digest.hexdigest()
+
+
 def load_cache(cache_name: str) -> T.Any:
     """Load cached object from disk.
 
@@ -51,9 +87,19 @@ def load_cache(cache_name: str) -> T.Any:
     cache_path = get_cache_file_path(cache_name)
     if cache_path.exists():
         with cache_path.open(mode="rb") as handle:
+            magic = handle.read(len(ZIP_MAGIC))
+            handle.seek(0)
             try:
+                if magic == ZIP_MAGIC:
+                    with np.load(handle, allow_pickle=False) as archive:
+                        return {key: archive[key] for key in archive.files}
                 return pickle.load(handle)
-            except EOFError:
+            except (
+                EOFError,
+                ValueError,
+                pickle.UnpicklingError,
+                zipfile.BadZipFile,
+            ):
                 return None
     return None
 
@@ -67,7 +113,17 @@ def save_cache(cache_name: str, data: T.Any) -> None:
     cache_path = get_cache_file_path(cache_name)
     cache_path.parent.mkdir(parents=True, exist_ok=True)
     with cache_path.open(mode="wb") as handle:
-        pickle.dump(data, handle)
+        # dictionaries of numpy arrays are stored in their native format,
+        # which loads with a single read per array rather than going through
+        # the unpickler
+        if (
+            isinstance(data, dict)
+            and data
+            and all(isinstance(value, np.ndarray) for value in data.values())
+        ):
+            np.savez(handle, **data)
+        else:
+            pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
 
 def wipe_cache() -> None:
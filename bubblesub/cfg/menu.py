@@ -16,6 +16,7 @@
 
 """Menu config."""
 
+import collections
 import enum
 import re
 import typing as T
@@ -26,6 +27,9 @@ from dataclasses import dataclass
 from bubblesub.cfg.base import ConfigError, SubConfig
 from bubblesub.data import DATA_DIR
 
+SECTION_HEADING_RE = re.compile(r"^\[(.*)\]$")
+INDENT_RE = re.compile("^ *")
+
 
 def _get_user_path(root_dir: Path) -> Path:
     return root_dir / "menu.conf"
@@ -88,14 +92,14 @@ def _get_node(token: str) -> MenuItem:
 
 
 def _recurse_tree(
-    parent: MenuItem, parent_depth: int, source: T.List[str]
+    parent: MenuItem, parent_depth: int, source: T.Deque[str]
 ) -> None:
     while source:
         last_line = source[0].rstrip()
         if not last_line:
             break
 
-        match = re.search("^ *", last_line)
+        match = INDENT_RE.match(last_line)
         assert match
         current_depth = len(match.group(0))
         if current_depth <= parent_depth:
@@ -105,7 +109,7 @@ def _recurse_tree(
         if current_depth <= parent_depth:
             continue
 
-        source.pop(0)
+        source.popleft()
         node = _get_node(token)
         if node.type == MenuItemType.SubMenu:
             _recurse_tree(node, current_depth, source)
@@ -153,15 +157,15 @@ class MenuConfig(SubConfig):
                     raise ConfigError(f"error loading {user_path}: {ex}")
 
     def _loads(self, text: str) -> None:
-        sections: T.Dict[MenuContext, str] = {}
+        sections: T.Dict[MenuContext, T.List[str]] = {}
         cur_context = MenuContext.MainMenu
-        lines = text.split("\n")
+        lines = collections.deque(text.split("\n"))
         while lines:
-            line = lines.pop(0).rstrip()
+            line = lines.popleft().rstrip()
             if not line or line.startswith("#"):
                 continue
 
-            match = re.match(r"^\[(.*)\]$", line)
+            match = SECTION_HEADING_RE.match(line)
             if match:
                 try:
                     cur_context = MenuContext(match.group(1))
@@ -171,12 +175,10 @@ class MenuConfig(SubConfig):
                     )
                 continue
 
-            if cur_context not in sections:
-                sections[cur_context] = ""
-            sections[cur_context] += line + "\n"
+            sections.setdefault(cur_context, []).append(line)
 
-        for context, section_text in sections.items():
-            source = section_text.split("\n")
+        for context, section_lines in sections.items():
+            source = collections.deque(section_lines)
             _recurse_tree(self._menu[context], -1, source)
 
     def __getitem__(self, context: MenuContext) -> MenuItem:
@@ -17,6 +17,8 @@
 """ASS file writer."""
 
 import functools
+import io
+import operator
 import typing as T
 from collections import OrderedDict
 from decimal import Decimal
@@ -26,11 +28,27 @@ from bubblesub.fmt.ass.event import AssEvent
 from bubblesub.fmt.ass.file import AssFile
 from bubblesub.fmt.ass.style import AssColor, AssStyle
 from bubblesub.fmt.ass.util import escape_ass_tag
-from bubblesub.util import ms_to_times
 
 NOTICE = (
     "Script generated by bubblesub\nhttps://github.com/bubblesub/bubblesub"
 )
+COLOR_FORMAT = "&H%02X%02X%02X%02X"
+BOOL_VALUES = ("0", "-1")
+STYLE_FORMAT = "Style: " + ",".join(["%s"] * 23)
+EVENT_ATTRS = operator.attrgetter(
+    "layer",
+    "start",
+    "end",
+    "style",
+    "actor",
+    "margin_left",
+    "margin_right",
+    "margin_vertical",
+    "effect",
+    "text",
+    "note",
+    "is_comment",
+)
 
 
 def _serialize_text(text: str) -> str:
@@ -38,7 +56,8 @@ def _serialize_text(text: str) -> str:
 
 
 def _serialize_color(col: AssColor) -> str:
-    return f"&H{col.alpha:02X}{col.blue:02X}{col.green:02X}{col.red:02X}"
+    # AssColor is (red, green, blue, alpha), ASS wants it as AABBGGRR
+    return COLOR_FORMAT % col[::-1]
 
 
 def _serialize_integer(value: int) -> str:
@@ -53,7 +72,9 @@ def _serialize_float(value: T.Union[int, float]) -> str:
 
 
 def _ms_to_timestamp(milliseconds: int) -> str:
-    hours, minutes, seconds, milliseconds = ms_to_times(milliseconds)
+    seconds, milliseconds = divmod(max(0, int(round(milliseconds))), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
     return f"{hours:01d}:{minutes:02d}:{seconds:02d}.{milliseconds // 10:02d}"
 
 
@@ -68,11 +89,13 @@ def write_meta(ass_file: AssFile, handle: T.IO[str]) -> None:
     meta.update(ass_file.meta.items())
     meta["ScriptType"] = "v4.00+"
 
-    print("[Script Info]", file=handle)
-    for line in NOTICE.splitlines(False):
-        print(";", line, file=handle)
-    for key, value in meta.items():
-        print(key, "" if value is None else value, sep=": ", file=handle)
+    lines = ["[Script Info]"]
+    lines.extend("; " + line for line in NOTICE.splitlines(False))
+    lines.extend(
+        key + ": " + ("" if value is None else value)
+        for key, value in meta.items()
+    )
+    handle.write("\n".join(lines) + "\n")
 
 
 def write_styles(ass_file: AssFile, handle: T.IO[str]) -> None:
@@ -81,17 +104,16 @@ def write_styles(ass_file: AssFile, handle: T.IO[str]) -> None:
     :param ass_file: ASS file to take the styles from
     :param handle: handle to write the styles to
     """
-    print("[V4+ Styles]", file=handle)
-    print(
+    lines = [
+        "[V4+ Styles]",
         "Format: Name, Fontname, Fontsize, PrimaryColour, "
         "SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
         "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
         "BorderStyle, Outline, Shadow, Alignment, "
         "MarginL, MarginR, MarginV, Encoding",
-        file=handle,
-    )
-    for style in ass_file.styles:
-        write_style(style, handle)
+    ]
+    lines.extend(serialize_style(style) for style in ass_file.styles)
+    handle.write("\n".join(lines) + "\n")
 
 
 @functools.lru_cache(maxsize=1024)
@@ -101,32 +123,30 @@ def serialize_style(style: AssStyle) -> str:
     :param style: ASS style to serialize
     :return: serialized ASS style
     """
-    return "Style: " + ",".join(
-        [
-            _serialize_text(style.name),
-            _serialize_text(style.font_name),
-            _serialize_integer(style.font_size),
-            _serialize_color(style.primary_color),
-            _serialize_color(style.secondary_color),
-            _serialize_color(style.outline_color),
-            _serialize_color(style.back_color),
-            "-1" if style.bold else "0",
-            "-1" if style.italic else "0",
-            "-1" if style.underline else "0",
-            "-1" if style.strike_out else "0",
-            _serialize_float(style.scale_x),
-            _serialize_float(style.scale_y),
-            _serialize_float(style.spacing),
-            _serialize_float(style.angle),
-            _serialize_integer(style.border_style),
-            _serialize_float(style.outline),
-            _serialize_float(style.shadow),
-            _serialize_integer(style.alignment),
-            _serialize_integer(style.margin_left),
-            _serialize_integer(style.margin_right),
-            _serialize_integer(style.margin_vertical),
-            _serialize_integer(style.encoding),
-        ]
+    return STYLE_FORMAT % (
+        _serialize_text(style.name),
+        _serialize_text(style.font_name),
+        _serialize_integer(style.font_size),
+        _serialize_color(style.primary_color),
+        _serialize_color(style.secondary_color),
+        _serialize_color(style.outline_color),
+        _serialize_color(style.back_color),
+        BOOL_VALUES[style.bold],
+        BOOL_VALUES[style.italic],
+        BOOL_VALUES[style.underline],
+        BOOL_VALUES[style.strike_out],
+        _serialize_float(style.scale_x),
+        _serialize_float(style.scale_y),
+        _serialize_float(style.spacing),
+        _serialize_float(style.angle),
+        _serialize_integer(style.border_style),
+        _serialize_float(style.outline),
+        _serialize_float(style.shadow),
+        _serialize_integer(style.alignment),
+        _serialize_integer(style.margin_left),
+        _serialize_integer(style.margin_right),
+        _serialize_integer(style.margin_vertical),
+        _serialize_integer(style.encoding),
     )
 
 
@@ -136,7 +156,7 @@ def write_style(style: AssStyle, handle: T.IO[str]) -> None:
     :param style: ASS style to write
     :param handle: handle to write the style to
     """
-    print(serialize_style(style), file=handle)
+    handle.write(serialize_style(style) + "\n")
 
 
 def write_events(ass_file: AssFile, handle: T.IO[str]) -> None:
@@ -145,14 +165,13 @@ def write_events(ass_file: AssFile, handle: T.IO[str]) -> None:
     :param ass_file: ASS file to take the events from
     :param handle: handle to write the events to
     """
-    print("[Events]", file=handle)
-    print(
+    lines = [
+        "[Events]",
         "Format: Layer, Start, End, Style, Name, "
         "MarginL, MarginR, MarginV, Effect, Text",
-        file=handle,
-    )
-    for event in ass_file.events:
-        write_event(event, handle)
+    ]
+    lines.extend(serialize_event(event) for event in ass_file.events)
+    handle.write("\n".join(lines) + "\n")
 
 
 @functools.lru_cache(maxsize=1024)
@@ -162,29 +181,45 @@ def serialize_event(event: AssEvent) -> str:
     :param event: ASS event to serialize
     :return: serialized ASS event
     """
-    text = event.text
-
-    if event.start is not None and event.end is not None:
-        text = "{TIME:%d,%d}" % (event.start, event.end) + text
-
-    if event.note:
-        text += "{NOTE:%s}" % escape_ass_tag(event.note.replace("\n", "\\N"))
-
-    event_type = "Comment" if event.is_comment else "Dialogue"
+    (
+        layer,
+        start,
+        end,
+        style,
+        actor,
+        margin_left,
+        margin_right,
+        margin_vertical,
+        effect,
+        text,
+        note,
+        is_comment,
+    ) = EVENT_ATTRS(event)
+
+    if start is not None and end is not None:
+        text = "{TIME:%d,%d}" % (start, end) + text
+
+    if note:
+        note = note.replace("\n", "\\N")
+        if "\\" in note or "{" in note or "}" in note:
+            note = escape_ass_tag(note)
+        text += "{NOTE:%s}" % note
+
+    event_type = "Comment" if is_comment else "Dialogue"
     return (
         event_type
         + ": "
         + ",".join(
             [
-                _serialize_integer(event.layer),
-                _ms_to_timestamp(event.start),
-                _ms_to_timestamp(event.end),
-                _serialize_text(event.style),
-                _serialize_text(event.actor),
-                _serialize_integer(event.margin_left),
-                _serialize_integer(event.margin_right),
-                _serialize_integer(event.margin_vertical),
-                _serialize_text(event.effect),
+                _serialize_integer(layer),
+                _ms_to_timestamp(start),
+                _ms_to_timestamp(end),
+                _serialize_text(style),
+                _serialize_text(actor),
+                _serialize_integer(margin_left),
+                _serialize_integer(margin_right),
+                _serialize_integer(margin_vertical),
+                _serialize_text(effect),
                 text,
             ]
         )
@@ -197,7 +232,7 @@ def write_event(event: AssEvent, handle: T.IO[str]) -> None:
     :param event: ASS event to write
     :param handle: handle to write the event to
     """
-    print(serialize_event(event), file=handle)
+    handle.write(serialize_event(event) + "\n")
 
 
 def write_ass(ass_file: AssFile, target: T.Union[Path, T.IO[str]]) -> None:
@@ -211,8 +246,12 @@ def write_ass(ass_file: AssFile, target: T.Union[Path, T.IO[str]]) -> None:
             write_ass(ass_file, handle)
             return
 
-    write_meta(ass_file, target)
-    print("", file=target)
-    write_styles(ass_file, target)
-    print("", file=target)
-    write_events(ass_file, target)
+    # render the whole document first so that the target gets encoded and
+    # written in one go
+    buffer = io.StringIO()
+    write_meta(ass_file, buffer)
+    buffer.write("\n")
+    write_styles(ass_file, buffer)
+    buffer.write("\n")
+    write_events(ass_file, buffer)
+    target.write(buffer.getvalue())
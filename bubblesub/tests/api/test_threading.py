@@ -0,0 +1,87 @@
+# bubblesub - ASS subtitle editor
+# Copyright (C) 2018 Marcin Kurczewski
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for bubblesub.api.threading module."""
+
+import threading
+import typing as T
+from unittest.mock import MagicMock
+
+from bubblesub.api.threading import QueueWorker
+
+
+class _BlockingWorker(QueueWorker):
+    """Queue worker that holds on to its first task until released."""
+
+    def __init__(self) -> None:
+        """Initialize self."""
+        super().__init__(MagicMock())
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.processed: T.List[T.Any] = []
+
+    def _process_task(self, task: T.Any) -> None:
+        """Process a task.
+
+        :param task: task to process
+        """
+        self.started.set()
+        self.release.wait()
+        self.processed.append(task)
+
+
+def _join(worker: QueueWorker) -> bool:
+    """Wait for all tasks of the given worker to be done.
+
+    :param worker: worker to wait for
+    :return: whether the tasks were done before the timeout
+    """
+    thread = threading.Thread(target=worker._queue.join, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    return not thread.is_alive()
+
+
+def test_clear_tasks_idle() -> None:
+    """Test that clearing tasks of an idle worker lets join() return."""
+    worker = _BlockingWorker()
+    for i in range(10):
+        worker.schedule_task(i)
+    worker.clear_tasks()
+    assert _join(worker)
+
+
+def test_clear_tasks_while_processing() -> None:
+    """Test clearing tasks while the worker is busy with one of them."""
+    worker = _BlockingWorker()
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    for i in range(10):
+        worker.schedule_task(i)
+    assert worker.started.wait(timeout=5)
+
+    worker.clear_tasks()
+    worker.release.set()
+    assert _join(worker)
+    assert worker.processed == [0]
+
+    worker.schedule_task(10)
+    assert _join(worker)
+    assert worker.processed == [0, 10]
+
+    worker.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
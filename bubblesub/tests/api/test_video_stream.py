@@ -17,13 +17,20 @@
 """Tests for bubblesub.api.video module."""
 
 import typing as T
+import uuid
 from pathlib import Path
 from unittest.mock import Mock, PropertyMock, patch
 
+import ffms2
 import numpy as np
+import PIL.Image
 import pytest
 
 from bubblesub.api.video import VideoStream
+from bubblesub.api.video_stream import (
+    _load_video_frame_info,
+    _load_video_source,
+)
 
 
 def _test_align_pts_to_frame(
@@ -201,3 +208,252 @@ def test_frame_idx_from_pts(
             )
         else:
             assert stream.frame_idx_from_pts(pts) == expected
+
+
+def _make_screenshot_stream() -> VideoStream:
+    """Create a video stream with three mocked frames.
+
+    Each frame is filled with its own index, which lets tests tell apart
+    which frame ended up in which screenshot.
+
+    :return: video stream
+    """
+    stream = VideoStream(Mock(), Mock(), Mock(), Path("dummy"))
+    stream.get_frame = Mock(  # type: ignore
+        side_effect=lambda idx, width, height: np.full(
+            (height, width, 3), idx, dtype=np.uint8
+        )
+    )
+    return stream
+
+
+def test_screenshots(tmp_path: Path) -> None:
+    """Test saving many screenshots at once.
+
+    :param tmp_path: temporary directory
+    """
+    targets = [(pts, tmp_path / f"{pts}.png") for pts in [25, 0, 15, 20, 5]]
+    with patch(
+        VideoStream.__module__ + "." + VideoStream.__name__ + ".timecodes",
+        new_callable=PropertyMock,
+        return_value=[0, 10, 20],
+    ), patch(VideoStream.__module__ + ".os.cpu_count", return_value=2):
+        stream = _make_screenshot_stream()
+        stream.screenshots(targets, include_subtitles=False, width=4, height=2)
+
+    get_frame = stream.get_frame  # type: ignore
+    assert [call[0] for call in get_frame.call_args_list] == [
+        (2, 4, 2),
+        (0, 4, 2),
+        (1, 4, 2),
+        (2, 4, 2),
+        (0, 4, 2),
+    ]
+    assert sorted(tmp_path.iterdir()) == sorted(path for _, path in targets)
+    for pts, path in targets:
+        with PIL.Image.open(path) as image:
+            assert image.size == (4, 2)
+            assert image.getpixel((0, 0)) == (pts // 10,) * 3
+
+
+def test_screenshots_decoding_error(tmp_path: Path) -> None:
+    """Test that errors raised while decoding frames are propagated.
+
+    :param tmp_path: temporary directory
+    """
+    with patch(
+        VideoStream.__module__ + "." + VideoStream.__name__ + ".timecodes",
+        new_callable=PropertyMock,
+        return_value=[0, 10, 20],
+    ):
+        stream = _make_screenshot_stream()
+        stream.get_frame.side_effect = RuntimeError("boom")  # type: ignore
+        with pytest.raises(RuntimeError, match="boom"):
+            stream.screenshots(
+                [(0, tmp_path / "0.png")],
+                include_subtitles=False,
+                width=4,
+                height=2,
+            )
+    assert not list(tmp_path.iterdir())
+
+
+def test_screenshots_saving_error(tmp_path: Path) -> None:
+    """Test that errors raised while saving images are propagated.
+
+    :param tmp_path: temporary directory
+    """
+    with patch(
+        VideoStream.__module__ + "." + VideoStream.__name__ + ".timecodes",
+        new_callable=PropertyMock,
+        return_value=[0, 10, 20],
+    ):
+        stream = _make_screenshot_stream()
+        with pytest.raises(FileNotFoundError):
+            stream.screenshots(
+                [
+                    (0, tmp_path / "0.png"),
+                    (10, tmp_path / "missing" / "10.png"),
+                ],
+                include_subtitles=False,
+                width=4,
+                height=2,
+            )
+
+
+def _make_frames_stream() -> VideoStream:
+    """Create a video stream with a mocked source and decoder.
+
+    Each decoded frame is filled with its own index, which lets tests tell
+    apart which frame ended up in which row.
+
+    :return: video stream
+    """
+    stream = VideoStream(Mock(), Mock(), Mock(), Path("dummy"))
+    stream._source = Mock()
+    stream._decode_frame = Mock(  # type: ignore
+        side_effect=lambda idx, width, height: np.full(
+            (height, width, 3), idx, dtype=np.uint8
+        )
+    )
+    return stream
+
+
+def test_get_frames() -> None:
+    """Test decoding many frames into an existing array."""
+    with patch(
+        VideoStream.__module__ + "." + VideoStream.__name__ + ".timecodes",
+        new_callable=PropertyMock,
+        return_value=[0, 10, 20, 30],
+    ):
+        stream = _make_frames_stream()
+        out = np.zeros((4, 2, 1, 3), dtype=np.uint8)
+        decoded = stream.get_frames([3, -1, 1, 4], 1, 2, out=out)
+
+    np.testing.assert_array_equal(decoded, [True, False, True, False])
+    decode_frame = stream._decode_frame  # type: ignore
+    assert [call[0] for call in decode_frame.call_args_list] == [
+        (3, 1, 2),
+        (1, 1, 2),
+    ]
+    np.testing.assert_array_equal(out[:, 0, 0, 0], [0, 1, 0, 3])
+    np.testing.assert_array_equal(out[1], np.full((2, 1, 3), 1))
+    np.testing.assert_array_equal(out[3], np.full((2, 1, 3), 3))
+
+
+def test_get_frames_no_source() -> None:
+    """Test decoding many frames of a video that failed to load."""
+    with patch(
+        VideoStream.__module__ + "." + VideoStream.__name__ + ".timecodes",
+        new_callable=PropertyMock,
+        return_value=[0, 10, 20, 30],
+    ):
+        stream = _make_frames_stream()
+        stream._source = None
+        out = np.zeros((4, 2, 1, 3), dtype=np.uint8)
+        decoded = stream.get_frames([0, 1], 1, 2, out=out)
+
+    assert not decoded.any()
+    assert not stream._decode_frame.called  # type: ignore
+    assert not out.any()
+
+
+def _load_video_source_with_indexer(
+    tmp_path: Path, received: T.Any, exitcode: int
+) -> T.Tuple[T.Any, Mock, Mock]:
+    """Load a video with a mocked indexing process.
+
+    :param tmp_path: temporary directory
+    :param received:
+        what the indexing process sends back, or an exception to raise when
+        receiving it
+    :param exitcode: exit code of the indexing process
+    :return: load result, mocked logging API and mocked FFMS index class
+    """
+    path = tmp_path / "video.mkv"
+    path.write_bytes(b"dummy")
+    log_api = Mock()
+    context = Mock()
+    receiver = Mock()
+    receiver.recv.side_effect = [received]
+    context.Pipe.return_value = (receiver, Mock())
+    context.Process.return_value.exitcode = exitcode
+    index_cls = Mock()
+    index_cls.read.side_effect = ffms2.Error("no index")
+    module = VideoStream.__module__
+    with patch(
+        module + ".get_cache_file_path",
+        side_effect=lambda name: tmp_path / "cache" / name,
+    ), patch(
+        module + ".multiprocessing.get_context", return_value=context
+    ), patch.object(
+        ffms2, "Index", index_cls
+    ), patch.object(
+        ffms2, "VideoSource"
+    ), patch(
+        module + "._load_video_frame_info", return_value=([], [])
+    ):
+        result = _load_video_source(log_api, uuid.uuid4(), path)
+    return result, log_api, index_cls
+
+
+def test_load_video_source_indexing_error(tmp_path: Path) -> None:
+    """Test that FFMS errors from the indexing process fail the load.
+
+    :param tmp_path: temporary directory
+    """
+    result, log_api, index_cls = _load_video_source_with_indexer(
+        tmp_path, ffms2.Error("bad video"), exitcode=0
+    )
+    assert result is None
+    assert "bad video" in log_api.error.call_args[0][0]
+    assert not index_cls.make.called
+
+
+def test_load_video_source_indexing_process_died(tmp_path: Path) -> None:
+    """Test that the indexing process dying fails the load.
+
+    :param tmp_path: temporary directory
+    """
+    result, log_api, index_cls = _load_video_source_with_indexer(
+        tmp_path, EOFError(), exitcode=-9
+    )
+    assert result is None
+    assert "exited with code -9" in log_api.error.call_args[0][0]
+    assert not log_api.warn.called
+    assert not index_cls.make.called
+
+
+def test_load_video_source_index_write_error(tmp_path: Path) -> None:
+    """Test that errors writing the index fall back to indexing in-process.
+
+    :param tmp_path: temporary directory
+    """
+    result, log_api, index_cls = _load_video_source_with_indexer(
+        tmp_path, PermissionError("read-only"), exitcode=0
+    )
+    assert result is not None
+    assert "read-only" in log_api.warn.call_args[0][0]
+    index_cls.make.assert_called_once_with(str(tmp_path / "video.mkv"))
+
+
+def test_load_video_frame_info_cache_errors(tmp_path: Path) -> None:
+    """Test that unusable cache entries and failing cache writes are ignored.
+
+    :param tmp_path: temporary directory
+    """
+    path = tmp_path / "video.mkv"
+    path.write_bytes(b"dummy")
+    log_api = Mock()
+    source = Mock()
+    source.track.timecodes = [20.0, 0.0, 9.6]
+    source.track.keyframes = [2, 0]
+    module = VideoStream.__module__
+    with patch(
+        module + ".load_cache", return_value={"timecodes": np.array([0])}
+    ), patch(module + ".save_cache", side_effect=PermissionError("denied")):
+        timecodes, keyframes = _load_video_frame_info(log_api, path, source)
+
+    np.testing.assert_array_equal(timecodes, [0, 10, 20])
+    np.testing.assert_array_equal(keyframes, [0, 2])
+    assert "denied" in log_api.warn.call_args[0][0]
@@ -21,8 +21,11 @@ import tempfile
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+import pytest
+
 from bubblesub.fmt.ass.file import AssFile
-from bubblesub.fmt.ass.writer import write_ass
+from bubblesub.fmt.ass.style import AssStyle
+from bubblesub.fmt.ass.writer import serialize_style, write_ass
 
 
 @patch(
@@ -85,3 +88,34 @@ def test_write_ass_file(
         content = path.read_text()
 
     assert content == "META\nSTYLES\nEVENTS"
+
+
+def test_serialize_style() -> None:
+    """Test serializing a style with default values."""
+    assert serialize_style(AssStyle(name="Default")) == (
+        "Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00202020,"
+        "&H7F202020,-1,0,0,0,100,100,0,0,1,3,0,2,20,20,20,1"
+    )
+
+
+@pytest.mark.parametrize(
+    "attr",
+    [
+        "font_size",
+        "border_style",
+        "alignment",
+        "margin_left",
+        "margin_right",
+        "margin_vertical",
+        "encoding",
+    ],
+)
+def test_serialize_style_non_integer(attr: str) -> None:
+    """Test that integer style fields reject fractional values.
+
+    :param attr: style attribute to break
+    """
+    style = AssStyle(name="Default")
+    setattr(style, attr, 1.5)
+    with pytest.raises(ValueError):
+        serialize_style(style)
@@ -0,0 +1,228 @@
+# bubblesub - ASS subtitle editor
+# Copyright (C) 2018 Marcin Kurczewski
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for bubblesub.cache module."""
+
+import os
+import typing as T
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from bubblesub.cache import (
+    FINGERPRINT_CHUNK_SIZE,
+    ZIP_MAGIC,
+    _get_file_fingerprint,
+    get_cache_file_path,
+    get_file_fingerprint,
+    load_cache,
+    save_cache,
+)
+
+
+@pytest.fixture(name="cache_dir")
+def fixture_cache_dir(tmp_path: Path) -> T.Iterator[Path]:
+    """Redirect the disk cache to a temporary directory.
+
+    :param tmp_path: temporary directory
+    :return: cache directory
+    """
+    with patch("bubblesub.cache.get_cache_dir", return_value=tmp_path):
+        yield tmp_path
+
+
+@pytest.fixture(autouse=True)
+def fixture_clear_fingerprints() -> None:
+    """Forget fingerprints memoized by other tests."""
+    _get_file_fingerprint.cache_clear()
+
+
+def test_missing(cache_dir: Path) -> None:
+    """Test loading a cache entry that doesn't exist.
+
+    :param cache_dir: cache directory
+    """
+    assert load_cache("test") is None
+
+
+def test_array_dict_round_trip(cache_dir: Path) -> None:
+    """Test saving and loading a dictionary of numpy arrays.
+
+    :param cache_dir: cache directory
+    """
+    data = {
+        "ints": np.array([1, -2, 3], dtype=np.int64),
+        "floats": np.linspace(0, 1, 5, dtype=np.float32),
+        "image": np.zeros((2, 3, 4), dtype=np.uint8),
+    }
+    save_cache("test", data)
+    assert get_cache_file_path("test").read_bytes().startswith(ZIP_MAGIC)
+
+    actual = load_cache("test")
+    assert actual.keys() == data.keys()
+    for key, value in data.items():
+        assert actual[key].dtype == value.dtype
+        np.testing.assert_array_equal(actual[key], value)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"key": "value", "list": [1, 2, 3]},
+        {"array": np.array([1, 2]), "other": 5},
+        {},
+        [1, 2, 3],
+        (b"\x00\x01", b"\x02"),
+        "text",
+    ],
+)
+def test_pickle_round_trip(cache_dir: Path, data: T.Any) -> None:
+    """Test saving and loading objects other than array dictionaries.
+
+    :param cache_dir: cache directory
+    :param data: object to persist
+    """
+    save_cache("test", data)
+    assert not get_cache_file_path("test").read_bytes().startswith(ZIP_MAGIC)
+
+    actual = load_cache("test")
+    assert type(actual) is type(data)
+    if isinstance(data, dict) and "array" in data:
+        np.testing.assert_array_equal(actual["array"], data["array"])
+        assert actual["other"] == data["other"]
+    else:
+        assert actual == data
+
+
+@pytest.mark.parametrize(
+    "data", [{"array": np.arange(1000)}, {"key": "value" * 100}]
+)
+def test_truncated(cache_dir: Path, data: T.Any) -> None:
+    """Test loading a cache entry that was cut short.
+
+    :param cache_dir: cache directory
+    :param data: object to persist
+    """
+    save_cache("test", data)
+    path = get_cache_file_path("test")
+    path.write_bytes(path.read_bytes()[: path.stat().st_size // 2])
+    assert load_cache("test") is None
+
+
+@pytest.mark.parametrize(
+    "content", [b"", b"garbage", ZIP_MAGIC + b"garbage", ZIP_MAGIC]
+)
+def test_corrupt(cache_dir: Path, content: bytes) -> None:
+    """Test loading a cache entry that doesn't hold a valid object.
+
+    :param cache_dir: cache directory
+    :param content: file content
+    """
+    path = get_cache_file_path("test")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    assert load_cache("test") is None
+
+
+def _overwrite(path: Path, offset: int, content: bytes) -> None:
+    """Overwrite part of a file, preserving its size and modification time.
+
+    :param path: path to the file
+    :param offset: where to write
+    :param content: what to write
+    """
+    stat = path.stat()
+    with path.open("r+b") as handle:
+        handle.seek(offset)
+        handle.write(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    _get_file_fingerprint.cache_clear()
+
+
+@pytest.fixture(name="big_file")
+def fixture_big_file(tmp_path: Path) -> Path:
+    """Create a file spanning more than two fingerprint chunks.
+
+    :param tmp_path: temporary directory
+    :return: path to the file
+    """
+    path = tmp_path / "video.mkv"
+    path.write_bytes(bytes(3 * FINGERPRINT_CHUNK_SIZE))
+    return path
+
+
+def test_fingerprint_stable(big_file: Path) -> None:
+    """Test that an unchanged file keeps its fingerprint.
+
+    :param big_file: file to fingerprint
+    """
+    fingerprint = get_file_fingerprint(big_file)
+    assert get_file_fingerprint(big_file) == fingerprint
+    _get_file_fingerprint.cache_clear()
+    assert get_file_fingerprint(big_file) == fingerprint
+
+
+@pytest.mark.parametrize(
+    "offset,changed",
+    [
+        (0, True),
+        (FINGERPRINT_CHUNK_SIZE - 1, True),
+        (FINGERPRINT_CHUNK_SIZE, False),
+        (2 * FINGERPRINT_CHUNK_SIZE - 1, False),
+        (2 * FINGERPRINT_CHUNK_SIZE, True),
+        (3 * FINGERPRINT_CHUNK_SIZE - 1, True),
+    ],
+)
+def test_fingerprint_content(
+    big_file: Path, offset: int, changed: bool
+) -> None:
+    """Test which content changes affect the fingerprint.
+
+    Only the head and the tail of the file are taken into account.
+
+    :param big_file: file to fingerprint
+    :param offset: where to change the file
+    :param changed: whether the fingerprint is expected to change
+    """
+    fingerprint = get_file_fingerprint(big_file)
+    _overwrite(big_file, offset, b"\xff")
+    assert (get_file_fingerprint(big_file) != fingerprint) == changed
+
+
+def test_fingerprint_mtime(big_file: Path) -> None:
+    """Test that touching a file changes its fingerprint.
+
+    :param big_file: file to fingerprint
+    """
+    fingerprint = get_file_fingerprint(big_file)
+    stat = big_file.stat()
+    os.utime(big_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert get_file_fingerprint(big_file) != fingerprint
+
+
+def test_fingerprint_size(big_file: Path) -> None:
+    """Test that growing a file changes its fingerprint.
+
+    :param big_file: file to fingerprint
+    """
+    fingerprint = get_file_fingerprint(big_file)
+    stat = big_file.stat()
+    with big_file.open("ab") as handle:
+        handle.write(b"\x00")
+    os.utime(big_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert get_file_fingerprint(big_file) != fingerprint
@@ -25,6 +25,7 @@ from sortedcontainers import SortedDict
 from bubblesub.api import Api
 from bubblesub.api.audio_stream import AudioStream
 from bubblesub.api.threading import QueueWorker
+from bubblesub.cache import load_cache, save_cache
 from bubblesub.fmt.ass.event import AssEvent
 from bubblesub.fmt.ass.util import ass_to_plaintext
 from bubblesub.ui.audio.base import SLIDER_SIZE, BaseLocalAudioWidget, DragMode
@@ -40,7 +41,17 @@ except ImportError:
 
 DERIVATION_SIZE = 10
 DERIVATION_DISTANCE = 6
+SAMPLE_WINDOW_SIZE = 2 << DERIVATION_SIZE
+SPECTRUM_HEIGHT = (1 << DERIVATION_SIZE) + 1
+SPECTRUM_SCALE = 9 / np.sqrt(2 * SAMPLE_WINDOW_SIZE)
 CHUNK_SIZE = 50
+FFTW_WISDOM_CACHE_NAME = "fftw-wisdom"
+SAMPLE_FORMAT_SCALES = {
+    ffms2.FFMS_FMT_S16: 1 / 32768.0,
+    ffms2.FFMS_FMT_S32: 1 / 4_294_967_296.0,
+    ffms2.FFMS_FMT_FLT: 1.0,
+    ffms2.FFMS_FMT_DBL: 1.0,
+}
 
 
 class SpectrumWorkerSignals(QtCore.QObject):
@@ -57,20 +68,26 @@ class SpectrumWorker(QueueWorker):
 
         if pyfftw is not None:
             self._input = pyfftw.empty_aligned(
-                2 << DERIVATION_SIZE, dtype=np.float32
+                SAMPLE_WINDOW_SIZE, dtype=np.float32
             )
             self._output = pyfftw.empty_aligned(
-                (1 << DERIVATION_SIZE) + 1, dtype=np.complex64
+                SPECTRUM_HEIGHT, dtype=np.complex64
             )
+            # measuring takes a while, so reuse the plans from earlier runs
+            wisdom = load_cache(FFTW_WISDOM_CACHE_NAME)
+            if wisdom is not None:
+                pyfftw.import_wisdom(wisdom)
             self._fftw = pyfftw.FFTW(
                 self._input, self._output, flags=("FFTW_MEASURE",)
             )
+            new_wisdom = pyfftw.export_wisdom()
+            if new_wisdom != wisdom:
+                save_cache(FFTW_WISDOM_CACHE_NAME, new_wisdom)
         else:
-            self._input = np.empty(2 << DERIVATION_SIZE, dtype=np.float32)
-            self._output = np.empty(
-                (1 << DERIVATION_SIZE) + 1, dtype=np.complex64
-            )
+            self._input = np.empty(SAMPLE_WINDOW_SIZE, dtype=np.float32)
+            self._output = np.empty(SPECTRUM_HEIGHT, dtype=np.complex64)
             self._fftw = None
+        self._magnitude = np.empty(SPECTRUM_HEIGHT, dtype=np.float32)
 
     def _process_task(self, task: T.Any) -> None:
         anything_changed = False
@@ -89,7 +106,6 @@ class SpectrumWorker(QueueWorker):
             return None
 
         first_sample = block_idx << DERIVATION_DISTANCE
-        sample_count = 2 << DERIVATION_SIZE
 
         if video_stream and video_stream.timecodes:
             first_sample -= (
@@ -98,33 +114,37 @@ class SpectrumWorker(QueueWorker):
         if first_sample < 0:
             first_sample = 0
 
-        samples = audio_stream.get_samples(first_sample, sample_count)
-        samples = np.mean(samples, axis=1)
         sample_fmt = audio_stream.sample_format
-
-        if sample_fmt == ffms2.FFMS_FMT_S16:
-            samples /= 32768.0
-        elif sample_fmt == ffms2.FFMS_FMT_S32:
-            samples /= 4_294_967_296.0
-        elif sample_fmt not in (ffms2.FFMS_FMT_FLT, ffms2.FFMS_FMT_DBL):
+        if sample_fmt is None:
+            return None
+        scale = SAMPLE_FORMAT_SCALES.get(sample_fmt)
+        if scale is None:
             raise RuntimeError(f"unknown sample format: {sample_fmt}")
 
-        self._input[0 : len(samples)] = samples
+        samples = audio_stream.get_samples(first_sample, SAMPLE_WINDOW_SIZE)
+
+        # average the channels and normalize the result in one go, directly
+        # into the FFT input buffer
+        target = self._input[0 : len(samples)]
+        np.sum(samples, axis=1, dtype=np.float32, out=target)
+        target *= scale / max(1, samples.shape[1])
 
         out = self._fftw()
 
-        scale_factor = 9 / np.sqrt(2 * (2 << DERIVATION_SIZE))
-        out = np.log10(
-            np.sqrt(np.real(out) * np.real(out) + np.imag(out) * np.imag(out))
-            * scale_factor
-            + 1
-        )
+        # computed in place to avoid a temporary array for every step;
+        # log10(x + 1) is folded into log1p and the final multiplication
+        magnitude = self._magnitude
+        np.abs(out, out=magnitude)
+        magnitude *= SPECTRUM_SCALE
+        np.log1p(magnitude, out=magnitude)
+        magnitude *= int(255 * self._api.playback.volume / 100) / np.log(10)
+        np.clip(magnitude, 0, 255, out=magnitude)
 
-        out *= int(255 * self._api.playback.volume / 100)
-        out = np.clip(out, 0, 255)
-        out = np.flip(out, axis=0)
-        out = out.astype(dtype=np.uint8)
-        return out
+        # the spectrogram is drawn with low frequencies at the bottom, so
+        # write the column reversed rather than flipping it afterwards
+        column = np.empty(SPECTRUM_HEIGHT, dtype=np.uint8)
+        np.copyto(column[::-1], magnitude, casting="unsafe")
+        return column
 
 
 class SubtitleRect:
@@ -258,7 +278,7 @@ class AudioPreview(BaseLocalAudioWidget):
         self._generate_color_table()
 
     def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
-        height = (1 << DERIVATION_SIZE) + 1
+        height = SPECTRUM_HEIGHT
         self._pixels = np.zeros([height, self.width()], dtype=np.uint8)
         self._schedule_current_audio_view()
 
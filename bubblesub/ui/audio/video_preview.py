@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import datetime
 import threading
 import typing as T
 import uuid
@@ -26,18 +27,47 @@ from bubblesub.api.log import LogApi
 from bubblesub.api.threading import QueueWorker
 from bubblesub.api.video import VideoApi
 from bubblesub.api.video_stream import VideoStream
-from bubblesub.cache import load_cache, save_cache
+from bubblesub.cache import get_cache_file_path, get_file_fingerprint
 from bubblesub.ui.audio.base import BaseLocalAudioWidget
 from bubblesub.util import chunks, sanitize_file_name
 
 _CACHE_LOCK = threading.Lock()
 BAND_RESOLUTION = 30
 CHUNK_SIZE = 500
+CACHE_UPDATE_INTERVAL = datetime.timedelta(milliseconds=50)
 VIDEO_BAND_SIZE = 10
+# RGBX, which Qt blits without unpacking 24-bit pixels on every paint
+PIXEL_SIZE = 4
 
 
 class VideoBandWorkerSignals(QtCore.QObject):
-    cache_updated = QtCore.pyqtSignal()
+    cache_updated = QtCore.pyqtSignal(int, int)
+
+
+def _open_cache_array(
+    cache_name: str, shape: T.Tuple[int, ...], dtype: T.Any
+) -> T.Tuple[np.ndarray, bool]:
+    path = get_cache_file_path(cache_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        try:
+            array = np.lib.format.open_memmap(str(path), mode="r+")
+        except (OSError, ValueError):
+            pass
+        else:
+            if array.shape == shape and array.dtype == dtype:
+                return array, True
+            del array
+    array = np.lib.format.open_memmap(
+        str(path), mode="w+", shape=shape, dtype=dtype
+    )
+    return array, False
+
+
+def _flush_cache_array(array: np.ndarray) -> None:
+    # arrays that couldn't be mapped to disk are kept only in memory
+    if isinstance(array, np.memmap):
+        array.flush()
 
 
 class VideoBandWorker(QueueWorker):
@@ -47,55 +77,99 @@ class VideoBandWorker(QueueWorker):
         self._video_api = video_api
 
         self.cache: T.Dict[uuid.UUID, np.array] = {}
+        self.valid: T.Dict[uuid.UUID, np.array] = {}
+        self._last_update = datetime.datetime.min
+        self._pending_update: T.Optional[T.Tuple[int, int]] = None
 
         video_api.stream_loaded.connect(self._on_video_stream_load)
 
     def _process_task(self, task: T.Any) -> None:
         stream, frame_indexes = task
-        anything_changed = False
-        for frame_idx in frame_indexes:
-            frame = stream.get_frame(frame_idx, 1, BAND_RESOLUTION)
-            if frame is None:
-                continue
-            frame = frame.reshape(BAND_RESOLUTION, 3)
-            with _CACHE_LOCK:
-                self.cache[stream.uid][frame_idx] = frame
-            anything_changed = True
-        if anything_changed:
-            self.signals.cache_updated.emit()
-            cache_name = self._get_cache_name(stream)
-            save_cache(cache_name, self.cache[stream.uid])
+
+        # the lock only guards swapping whole arrays in and out; writing into
+        # them is benign, as readers at worst see a row that is still blank.
+        # the mask is updated last so it never marks a row not written yet.
+        cache = self.cache.get(stream.uid)
+        valid = self.valid.get(stream.uid)
+        if cache is None or valid is None:
+            return
+
+        # decoded 1x30 frames go straight into the RGB channels of the slab
+        decoded = stream.get_frames(
+            frame_indexes,
+            1,
+            BAND_RESOLUTION,
+            out=cache[:, :, np.newaxis, 0:3],
+        )
+        if not decoded.any():
+            return
+        frame_indexes = np.asarray(frame_indexes)[decoded]
+        valid[frame_indexes] = True
+        _flush_cache_array(cache)
+        _flush_cache_array(valid)
+
+        first_frame_idx = int(frame_indexes.min())
+        last_frame_idx = int(frame_indexes.max())
+        if self._pending_update:
+            first_frame_idx = min(first_frame_idx, self._pending_update[0])
+            last_frame_idx = max(last_frame_idx, self._pending_update[1])
+        self._pending_update = (first_frame_idx, last_frame_idx)
+
+        # the last chunk always gets through, so the view ends up complete
+        now = datetime.datetime.now()
+        if (
+            self._queue.empty()
+            or now - self._last_update >= CACHE_UPDATE_INTERVAL
+        ):
+            self._last_update = now
+            self._pending_update = None
+            self.signals.cache_updated.emit(first_frame_idx, last_frame_idx)
+
+    def _save_cache(self, stream: VideoStream) -> None:
+        # the arrays are memory mapped, so only the pages touched since the
+        # last flush get written
+        _flush_cache_array(self.cache[stream.uid])
+        _flush_cache_array(self.valid[stream.uid])
 
     def _get_cache_name(self, stream: VideoStream) -> str:
         try:
-            size = stream.path.stat().st_size
+            fingerprint = get_file_fingerprint(stream.path)
         except FileNotFoundError:
-            size = 0
-        return sanitize_file_name(stream.path) + f"-{size}-video-band"
+            fingerprint = "0"
+        return sanitize_file_name(stream.path) + f"-{fingerprint}-video-band"
 
     def _on_video_stream_unload(self, stream: VideoStream) -> None:
         with _CACHE_LOCK:
             # TODO: this also clears queue for unrelated streams!
             self.clear_tasks()
-            cache_name = self._get_cache_name(stream)
-            save_cache(cache_name, self.cache[stream.uid])
+            self._save_cache(stream)
             del self.cache[stream.uid]
+            del self.valid[stream.uid]
 
     def _on_video_stream_load(self, stream: VideoStream) -> None:
+        frame_count = len(stream.timecodes)
+        frames_shape = (frame_count, BAND_RESOLUTION, PIXEL_SIZE)
+        cache_name = self._get_cache_name(stream)
         with _CACHE_LOCK:
-            cache_name = self._get_cache_name(stream)
-            cache = load_cache(cache_name)
-            if cache is None:
-                cache = np.zeros(
-                    [len(stream.timecodes), BAND_RESOLUTION, 3], dtype=np.uint8
+            try:
+                frames, frames_reused = _open_cache_array(
+                    cache_name + "-frames", frames_shape, np.uint8
                 )
-            self.cache[stream.uid] = cache
-
-            not_cached_frames = [
-                frame_idx
-                for frame_idx in range(cache.shape[0])
-                if not np.count_nonzero(cache[frame_idx])
-            ]
+                valid, _valid_reused = _open_cache_array(
+                    cache_name + "-valid", (frame_count,), np.bool_
+                )
+            except OSError as ex:
+                self._log_api.warn(f"error caching video band ({ex})")
+                frames = np.zeros(frames_shape, dtype=np.uint8)
+                valid = np.zeros(frame_count, dtype=np.bool_)
+                frames_reused = False
+            if not frames_reused:
+                frames[:, :, 3] = 0xFF
+                valid[:] = False
+            self.cache[stream.uid] = frames
+            self.valid[stream.uid] = valid
+
+            not_cached_frames = np.flatnonzero(~valid).tolist()
             for chunk in chunks(not_cached_frames, CHUNK_SIZE):
                 self._queue.put((stream, chunk))
 
@@ -107,10 +181,12 @@ class VideoPreview(BaseLocalAudioWidget):
             QtWidgets.QSizePolicy.Ignored, QtWidgets.QSizePolicy.Preferred
         )
 
-        self._pixels: np.array = np.zeros([0, 0, 3], dtype=np.uint8)
+        self._pixels: np.array = np.zeros(
+            [0, BAND_RESOLUTION, PIXEL_SIZE], dtype=np.uint8
+        )
 
         self._worker = VideoBandWorker(api.log, api.video)
-        self._worker.signals.cache_updated.connect(self.repaint)
+        self._worker.signals.cache_updated.connect(self._on_cache_update)
         self._api.threading.schedule_runnable(self._worker)
 
         api.video.stream_loaded.connect(self.repaint_if_needed)
@@ -142,46 +218,84 @@ class VideoPreview(BaseLocalAudioWidget):
         self._worker.stop()
 
     def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
+        # stored column-major, i.e. one contiguous band row per widget column
         self._pixels = np.zeros(
-            [BAND_RESOLUTION, self.width(), 3], dtype=np.uint8
+            [self.width(), BAND_RESOLUTION, PIXEL_SIZE], dtype=np.uint8
         )
+        self._pixels[:, :, 3] = 0xFF
 
     def paintEvent(self, event: QtGui.QPaintEvent) -> None:
         painter = QtGui.QPainter()
 
         painter.begin(self)
-        self._draw_video_band(painter)
+        self._draw_video_band(painter, event.rect())
         self._draw_frame(painter, bottom_line=False)
         painter.end()
 
-    def _draw_video_band(self, painter: QtGui.QPainter) -> None:
+    def _on_cache_update(
+        self, first_frame_idx: int, last_frame_idx: int
+    ) -> None:
+        current_stream = self._api.video.current_stream
+        if not current_stream or not current_stream.timecodes:
+            return
+
+        # only the columns showing the freshly decoded frames need a repaint;
+        # they are found with the same mapping the band is drawn with
+        pts_range = np.linspace(
+            self.pts_from_x(0), self.pts_from_x(self.width() - 1), self.width()
+        )
+        frame_idx_range = current_stream.frame_idx_from_pts(pts_range)
+        x1 = int(np.searchsorted(frame_idx_range, first_frame_idx, "left"))
+        x2 = int(np.searchsorted(frame_idx_range, last_frame_idx, "right"))
+        if x1 < x2:
+            self.update(x1, 0, x2 - x1, self.height())
+
+    def _draw_video_band(
+        self, painter: QtGui.QPainter, rect: QtCore.QRect
+    ) -> None:
         current_stream = self._api.video.current_stream
         if not current_stream or not current_stream.timecodes:
             return
 
-        pixels = self._pixels.transpose(1, 0, 2)
+        x1 = max(0, rect.left())
+        x2 = min(self._pixels.shape[0], rect.right() + 1)
+        if x1 >= x2:
+            return
 
         min_pts = self.pts_from_x(0)
         max_pts = self.pts_from_x(self.width() - 1)
 
-        pts_range = np.linspace(min_pts, max_pts, self.width())
+        pts_range = np.linspace(min_pts, max_pts, self.width())[x1:x2]
         frame_idx_range = self._api.video.current_stream.frame_idx_from_pts(
             pts_range
         )
 
         cache = self._worker.cache.get(current_stream.uid)
         if cache is not None:
-            for x, frame_idx in enumerate(frame_idx_range):
-                pixels[x] = cache[frame_idx]
+            np.take(
+                cache,
+                frame_idx_range,
+                axis=0,
+                out=self._pixels[x1:x2],
+                mode="clip",
+            )
 
+        # the image is the band turned on its side: one row per widget column
         image = QtGui.QImage(
             self._pixels.data,
             self._pixels.shape[1],
             self._pixels.shape[0],
             self._pixels.strides[0],
-            QtGui.QImage.Format_RGB888,
+            QtGui.QImage.Format_RGBX8888,
         )
         painter.save()
-        painter.scale(1, painter.viewport().height() / (BAND_RESOLUTION - 1))
-        painter.drawPixmap(0, 0, QtGui.QPixmap.fromImage(image))
+        painter.setTransform(QtGui.QTransform(0, 1, 1, 0, 0, 0))
+        # stretch the band rows with plain nearest neighbour sampling, same
+        # as broadcasting each of them over several widget rows would
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
+        painter.drawImage(
+            QtCore.QRect(0, x1, self.height(), x2 - x1),
+            image,
+            QtCore.QRect(0, x1, image.width(), x2 - x1),
+        )
         painter.restore()